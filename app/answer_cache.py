@@ -0,0 +1,80 @@
+# app/answer_cache.py
+import os
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from cachetools import TTLCache
+from .embeddings import normalize_query
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "4096"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Set ANSWER_CACHE=0 to always call the LLM
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") != "0"
+
+
+class AnswerCache:
+    """
+    Exact-match cache of LLM answers keyed by (user corpus version, normalized
+    question, chunk ids sent, digest of the history sent). Bumping a user's
+    corpus version on upload makes all of that user's older entries
+    unreachable; they age out of the LRU/TTL cache on their own.
+
+    Each user has one conversation that grows every turn, so a key repeats
+    only for prompts sent without history: a user's first turn, turns whose
+    history didn't fit the budget, or every turn with HISTORY_BUDGET_SHARE=0.
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key(self, user_id: str, question: str, chunk_ids: list[str], history: list[dict]) -> str:
+        history_digest = hashlib.sha256(
+            json.dumps([(m["role"], m["content"]) for m in history]).encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            version = self._versions[user_id]
+        raw = json.dumps([user_id, version, normalize_query(question), list(chunk_ids), history_digest])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        with self._lock:
+            answer = self._cache.get(key)
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def put(self, key: str, answer: str):
+        if ANSWER_CACHE_ENABLED and answer:
+            with self._lock:
+                self._cache[key] = answer
+
+    def invalidate_user(self, user_id: str):
+        """Call when a user's visible documents change."""
+        with self._lock:
+            self._versions[user_id] += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,98 @@
+# app/bulk_writer.py
+import os
+import time
+import logging
+from chromadb.errors import ChromaError
+
+logger = logging.getLogger(__name__)
+
+# Records per Chroma write; also capped by the client's own max batch size
+CHROMA_WRITE_BATCH = int(os.getenv("CHROMA_WRITE_BATCH", "512"))
+CHROMA_WRITE_RETRIES = int(os.getenv("CHROMA_WRITE_RETRIES", "3"))
+
+
+class BulkWriter:
+    """
+    Buffers records for a Chroma collection and flushes them in bounded batches
+    as they are produced. Flushes use upsert, so a batch that failed part-way
+    can simply be retried.
+
+        with BulkWriter(collection, client=get_chroma_client()) as writer:
+            writer.add(ids, documents, embeddings, metadatas)
+    """
+
+    def __init__(self, collection, client=None, batch_size: int = CHROMA_WRITE_BATCH,
+                 retries: int = CHROMA_WRITE_RETRIES, on_flush=None):
+        # `client` owns the collection; when given, batches are capped at its max batch size
+        if client is not None:
+            try:
+                batch_size = min(batch_size, client.get_max_batch_size())
+            except ChromaError as e:
+                logger.warning("Could not read Chroma max batch size (%s), using %d", e, batch_size)
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.on_flush = on_flush  # called with the number of records written
+        self._ids, self._documents, self._embeddings, self._metadatas = [], [], [], []
+        self.written = 0
+        self.flushes = 0
+        self.retried = 0
+        self._started = None
+        self._write_seconds = 0.0
+
+    def add(self, ids, documents, embeddings, metadatas):
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._embeddings.extend(embeddings)
+        self._metadatas.extend(metadatas)
+        while len(self._ids) >= self.batch_size:
+            self._write(self.batch_size)
+
+    def flush(self):
+        while self._ids:
+            self._write(self.batch_size)
+
+    def _write(self, n: int):
+        batch = dict(
+            ids=self._ids[:n],
+            documents=self._documents[:n],
+            embeddings=self._embeddings[:n],
+            metadatas=self._metadatas[:n],
+        )
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                self.collection.upsert(**batch)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                logger.warning("Chroma write of %d records failed (%s), retrying", len(batch["ids"]), e)
+                time.sleep(0.2 * 2 ** attempt)
+        self._write_seconds += time.perf_counter() - start
+        del self._ids[:n], self._documents[:n], self._embeddings[:n], self._metadatas[:n]
+        self.written += len(batch["ids"])
+        self.flushes += 1
+        if self.on_flush:
+            self.on_flush(len(batch["ids"]))
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            "written": self.written,
+            "flushes": self.flushes,
+            "retries": self.retried,
+            "chunks_per_sec": round(self.written / elapsed, 2) if elapsed > 0 else 0.0,
+            "write_chunks_per_sec": round(self.written / self._write_seconds, 2) if self._write_seconds > 0 else 0.0,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
@@ -1,65 +1,231 @@
 # app/chat.py
+#
+# Concurrency: the event loop only awaits here. The Groq call uses AsyncGroq, history
+# and conversations use the async DB layer (app/db_async.py), and the blocking Chroma
+# query / embedding run in Starlette's thread pool (anyio default: 40 threads, see
+# THREADPOOL_SIZE in main.py). A worker can therefore hold roughly THREADPOOL_SIZE
+# requests in retrieval at once and an unbounded number waiting on the LLM or the
+# database, which is where most of the request time is spent.
 import os
+import json
+import time
+import asyncio
 from fastapi import APIRouter, Depends, Form
-from app.db_helpers import get_or_create_conversation
-from groq import Groq # type: ignore
-from .db import get_collection
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from groq import AsyncGroq # type: ignore
+from .db import get_collection, user_filter
+from .embeddings import embed_query
 from .schemas import ChatResponse
-from .ingest import save_message, get_history
+from .answer_cache import answer_cache
+from .semantic_cache import semantic_cache
+from .write_behind import message_writer
+from .prompt_budget import build_prompt, RESPONSE_TOKEN_RESERVE
 
 router = APIRouter()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
 
-def retrieve_context(query: str, collection, user_id: str):
-    # Query only documents belonging to this user
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def retrieve_context(query: str, collection, user_id: str, timings: dict | None = None):
+    """Return (documents, chunk_ids, query_embedding) for the top matches visible to this user, best first."""
+    # Query only documents belonging to this user; embed with the shared model
+    start = time.perf_counter()
+    query_embedding = embed_query(query)
+    if timings is not None:
+        timings["embed_ms"] = elapsed_ms(start)
+    start = time.perf_counter()
     results = collection.query(
-        query_texts=[query],
+        query_embeddings=[query_embedding],
         n_results=5,
-        where={"user_id": user_id}  # filter to user-specific docs
+        where=user_filter(user_id)  # filter to docs visible to this user
     )
+    if timings is not None:
+        timings["vector_query_ms"] = elapsed_ms(start)
     documents = [doc for sublist in results['documents'] for doc in sublist]
-    return "\n".join(documents)
+    ids = [_id for sublist in results['ids'] for _id in sublist]
+    return documents, ids, query_embedding
+
+SYSTEM_PROMPT = "You are a helpful assistant. Use the provided context to answer the user's question. If the answer is not in the context, say: I don't know based on the provided information. Do NOT use outside knowledge."
+CHAT_MODEL = "llama-3.3-70b-versatile"
+
+
+class PreparedChat:
+    """Output of the pre-LLM stages: everything needed to answer or serve from cache."""
+
+    def __init__(self, question, conversation_id, messages, timings, cache_key, chunk_ids, query_embedding, prompt):
+        self.question = question
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.prompt = prompt  # token budget report
+        self.timings = timings
+        self.cache_key = cache_key
+        self.chunk_ids = chunk_ids
+        self.query_embedding = query_embedding
+
+
+async def prepare_chat(user_id: str, message: str, collection) -> PreparedChat:
+    """
+    Shared pre-LLM stages for /chat and /chat/stream.
+    Retrieval (query embedding + vector search) runs concurrently with the
+    conversation -> history lookups; returns per-stage timings in ms.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    # 1 + 3. Get or create conversation and its past history (one DB round trip)
+    async def load_history():
+        t = time.perf_counter()
+        result = await message_writer.load(user_id, limit=10)
+        timings["history_ms"] = elapsed_ms(t)
+        return result
+
+    # 2. Retrieve RAG context
+    async def load_context():
+        t = time.perf_counter()
+        result = await run_in_threadpool(retrieve_context, message, collection, user_id, timings)
+        timings["retrieval_ms"] = elapsed_ms(t)
+        return result
+
+    (conversation_id, history_messages), (documents, chunk_ids, query_embedding) = await asyncio.gather(
+        load_history(), load_context()
+    )
+    timings["prepare_ms"] = elapsed_ms(start)
+
+    # 4. Build full message list for Groq within the prompt token budget
+    #    (oldest history and lowest-ranked chunks are dropped first)
+    messages, prompt = build_prompt(SYSTEM_PROMPT, history_messages, documents, message)
+    # key on what is actually sent: the budgeted history and the chunks kept
+    cache_key = answer_cache.key(user_id, message, chunk_ids[:prompt["chunks_used"]], messages[1:-1])
+    return PreparedChat(message, conversation_id, messages, timings, cache_key, chunk_ids, query_embedding, prompt)
+
+
+def cached_answer(user_id: str, prepared: PreparedChat):
+    """Exact match first, then a paraphrase from the semantic cache. Returns (answer, cache)."""
+    answer = answer_cache.get(prepared.cache_key)
+    if answer is not None:
+        return answer, "exact"
+    answer = semantic_cache.lookup(
+        user_id, prepared.question, prepared.query_embedding, prepared.chunk_ids, prepared.messages[1:-1]
+    )
+    if answer is not None:
+        return answer, "semantic"
+    return None, None
+
+
+def cache_answer(user_id: str, prepared: PreparedChat, answer: str):
+    answer_cache.put(prepared.cache_key, answer)
+    semantic_cache.put(
+        user_id, prepared.question, prepared.query_embedding, answer, prepared.chunk_ids, prepared.messages[1:-1]
+    )
+
+
+async def save_turn(conversation_id, message: str, answer: str):
+    # queued for the background writer; committed inline when MESSAGE_DURABILITY=sync
+    await message_writer.save([
+        (conversation_id, "user", message),
+        (conversation_id, "assistant", answer),
+    ])
+
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     user_id: str = Form(...),
     message: str = Form(...),
+    no_cache: bool = Form(False),  # Regenerate: always ask the model
     collection=Depends(get_collection)
 ):
-    # 1. Get or create conversation
-    conversation_id = get_or_create_conversation(user_id) 
+    prepared = await prepare_chat(user_id, message, collection)
+    timings = prepared.timings
 
-    # 2. Retrieve RAG context
-    context = retrieve_context(message, collection, user_id)
-
-    # 3. Retrieve past conversation history for this user
-    history_messages = get_history(conversation_id, limit=10)
-
-    # 4. Build full message list for Groq
-    messages = [
-        {
-  "role": "system",
-  "content": "You are a helpful assistant. Use the provided context to answer the user's question. If the answer is not in the context, say: I don't know based on the provided information. Do NOT use outside knowledge."
-}
-
-    ]
-    messages.extend(history_messages)
-    messages.append({"role": "user", "content": f"Context:\n{context}\n\nQuestion: {message}"})
-
-    # 5. Call Groq API
-    response = client.chat.completions.create(
-        messages=messages,
-        model="llama-3.3-70b-versatile",
-        stream=False
-    )
-    answer = response.choices[0].message.content
+    # 5. Serve repeated or paraphrased questions from the answer caches, otherwise call Groq API
+    answer, cache = (None, None) if no_cache else cached_answer(user_id, prepared)
+    if answer is None:
+        t = time.perf_counter()
+        response = await client.chat.completions.create(
+            messages=prepared.messages,
+            model=CHAT_MODEL,
+            max_tokens=RESPONSE_TOKEN_RESERVE,
+            stream=False
+        )
+        answer = response.choices[0].message.content
+        timings["llm_ms"] = elapsed_ms(t)
+        cache_answer(user_id, prepared, answer)
 
     # 6. Save messages
-    save_message(conversation_id, "user", message)
-    save_message(conversation_id, "assistant", answer)
+    await save_turn(prepared.conversation_id, message, answer)
 
     # 7. Return both fields
     return ChatResponse(
         answer=answer,
-        conversation_id=conversation_id
+        conversation_id=prepared.conversation_id,
+        timings=timings,
+        cache=cache,
+        prompt=prepared.prompt
+    )
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(
+    user_id: str = Form(...),
+    message: str = Form(...),
+    no_cache: bool = Form(False),
+    collection=Depends(get_collection)
+):
+    """
+    Server-Sent Events variant of /chat: a `meta` event with the conversation id,
+    one `data` event per token delta, then `done` (or `error`). Messages are saved
+    once the completion has finished streaming. Cached answers arrive as one token
+    (unless no_cache is set).
+    """
+    prepared = await prepare_chat(user_id, message, collection)
+    conversation_id = prepared.conversation_id
+    cached, cache = (None, None) if no_cache else cached_answer(user_id, prepared)
+
+    async def event_stream():
+        yield sse_event(
+            {"conversation_id": conversation_id, "timings": prepared.timings, "cache": cache,
+             "prompt": prepared.prompt},
+            event="meta",
+        )
+        if cached is not None:
+            yield sse_event({"token": cached})
+            await save_turn(conversation_id, message, cached)
+            yield sse_event({"answer": cached, "conversation_id": conversation_id}, event="done")
+            return
+
+        parts = []
+        try:
+            stream = await client.chat.completions.create(
+                messages=prepared.messages,
+                model=CHAT_MODEL,
+                max_tokens=RESPONSE_TOKEN_RESERVE,
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield sse_event({"token": delta})
+        except Exception as e:
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+
+        answer = "".join(parts)
+        cache_answer(user_id, prepared, answer)
+        await save_turn(conversation_id, message, answer)
+        yield sse_event({"answer": answer, "conversation_id": conversation_id}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
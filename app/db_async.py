@@ -0,0 +1,84 @@
+# app/db_async.py
+#
+# Async operations for request handlers, so the event loop never waits on
+# database I/O: only what the chat path and uploads need. Same database, schema,
+# statements and conversation-id cache as the sync layer in app/db_helpers.py.
+import os
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from .db import DATABASE_URL, Message, Document, sqlite_pragmas, is_sqlite, engine_options
+from .db_helpers import (
+    record_op, recent_messages_stmt, create_conversation_if_absent_stmt, latest_conversation_stmt,
+    conversation_lock_stmt,
+    as_history, cached_conversation_id, remember_conversation,
+)
+
+
+
+def async_url(url: str) -> str:
+    """Async driver for the configured database: aiosqlite or asyncpg."""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+_options = engine_options(ASYNC_DATABASE_URL)
+_options.pop("connect_args", None)  # check_same_thread doesn't apply to aiosqlite
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_options)
+if is_sqlite(ASYNC_DATABASE_URL):
+    event.listen(async_engine.sync_engine, "connect", sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def session_scope(op: str = "query"):
+    """One pooled connection and one transaction; records per-operation latency."""
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+        finally:
+            record_op(op, (time.perf_counter() - start) * 1000)
+
+
+async def _get_or_create_conversation_id(db, user_id) -> int:
+    lock = conversation_lock_stmt(db, user_id)
+    if lock is not None:
+        await db.execute(lock)
+    new_id = (await db.execute(create_conversation_if_absent_stmt(user_id))).scalar()
+    return new_id or (await db.execute(latest_conversation_stmt(user_id))).scalar()
+
+
+async def load_conversation(user_id, limit: int = 10):
+    """Conversation id plus its recent history, on one connection and transaction."""
+    conversation_id = cached_conversation_id(user_id)
+    async with session_scope("load_conversation") as db:
+        if conversation_id is None:
+            conversation_id = await _get_or_create_conversation_id(db, user_id)
+        rows = (await db.execute(recent_messages_stmt(conversation_id, limit))).all()
+    remember_conversation(user_id, conversation_id)
+    return conversation_id, as_history(rows)
+
+
+async def save_messages(rows: list[tuple]):
+    """Save (conversation_id, role, content) rows in one transaction."""
+    async with session_scope("save_messages") as db:
+        await db.execute(insert(Message), [
+            {"conversation_id": cid, "role": role, "content": content} for cid, role, content in rows
+        ])
+
+
+async def register_document(file_id: str, user_id: str, filename: str, content_hash: str):
+    async with session_scope("register_document") as db:
+        db.add(Document(id=file_id, user_id=user_id, filename=filename, content_hash=content_hash))
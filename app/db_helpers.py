@@ -1,6 +1,58 @@
 # app/db_helpers.py
+#
+# The data-access layer for the app database (app/db.py): users, conversations,
+# messages and the document registry. Statements are built here once; request
+# handlers run them through the async operations in app/db_async.py, ingestion
+# workers and CLI scripts through the sync ones below.
+import os
+import time
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from .db import SessionLocal, User, Conversation, Message
+from cachetools import LRUCache
+from sqlalchemy import insert, select, exists, literal, text
+from sqlalchemy.exc import IntegrityError
+from .db import SessionLocal, User, Conversation, Message, DocumentChunk
+
+# user_id -> latest conversation id; per process, refreshed when a conversation is created
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "10000"))
+_conversation_cache = LRUCache(maxsize=CONVERSATION_CACHE_SIZE)
+_conversation_lock = threading.Lock()
+
+_op_stats = {}
+_op_stats_lock = threading.Lock()
+
+
+@contextmanager
+def session_scope(op: str = "query"):
+    """One pooled connection and one transaction; records per-operation latency."""
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        record_op(op, (time.perf_counter() - start) * 1000)
+
+
+def record_op(op: str, elapsed_ms: float):
+    with _op_stats_lock:
+        s = _op_stats.setdefault(op, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["count"] += 1
+        s["total_ms"] += elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+
+
+def op_stats() -> dict:
+    with _op_stats_lock:
+        return {
+            op: {"count": s["count"], "avg_ms": round(s["total_ms"] / s["count"], 3), "max_ms": round(s["max_ms"], 3)}
+            for op, s in _op_stats.items()
+        }
 
 
 def create_user(name: str = "RG"):
@@ -20,6 +72,8 @@ def create_conversation(user_id: int, title: str = ''):
     db.commit()
     db.refresh(c)
     db.close()
+    # the new conversation is now the user's latest
+    remember_conversation(user_id, c.id)
     return c
 
 
@@ -33,6 +87,96 @@ def save_message(conversation_id: int, role: str, content: str):
     return m
 
 
+# Statements shared with the async layer (app/db_async.py)
+
+def recent_messages_stmt(conversation_id, limit):
+    return (
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(limit)
+    )
+
+
+def create_conversation_if_absent_stmt(user_id):
+    # Insert only if the user has no conversation yet: new users get their id
+    # back from this single statement, without a read-then-write round trip.
+    # Atomic on SQLite (one writer); on Postgres run conversation_lock_stmt first
+    return (
+        insert(Conversation)
+        .from_select(
+            ["user_id", "title", "created_at"],
+            select(literal(user_id), literal("Chat Session"), literal(datetime.utcnow()))
+            .where(~exists().where(Conversation.user_id == user_id)),
+        )
+        .returning(Conversation.id)
+    )
+
+
+# pg_advisory_xact_lock namespace for per-user conversation creation
+CONVERSATION_LOCK_NAMESPACE = 7215002
+
+
+def conversation_lock_stmt(db, user_id):
+    """
+    Postgres only: under READ COMMITTED two first requests from one user can both
+    pass the NOT EXISTS check and create two conversations. A per-user lock held
+    to the end of the transaction makes the second wait, then see the first's row.
+    Returns None for other databases.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return text("SELECT pg_advisory_xact_lock(:ns, hashtext(:user_id))").bindparams(
+        ns=CONVERSATION_LOCK_NAMESPACE, user_id=str(user_id)
+    )
+
+
+def latest_conversation_stmt(user_id):
+    return (
+        select(Conversation.id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc())
+        .limit(1)
+    )
+
+
+def chunk_ids_stmt(content_hash):
+    return select(DocumentChunk.chunk_id).where(DocumentChunk.content_hash == content_hash)
+
+
+def as_history(rows) -> list[dict]:
+    return [{"role": r, "content": c} for r, c in reversed(rows)]
+
+
+def cached_conversation_id(user_id):
+    with _conversation_lock:
+        return _conversation_cache.get(user_id)
+
+
+def remember_conversation(user_id, conversation_id):
+    with _conversation_lock:
+        _conversation_cache[user_id] = conversation_id
+
+
+def indexed_chunk_ids(content_hash: str) -> list[str]:
+    with session_scope("indexed_chunk_ids") as db:
+        return list(db.execute(chunk_ids_stmt(content_hash)).scalars())
+
+
+def save_document_chunks(content_hash: str, chunk_ids: list[str], retry: bool = True):
+    try:
+        with session_scope("save_document_chunks") as db:
+            known = set(db.execute(chunk_ids_stmt(content_hash)).scalars())
+            new = [cid for cid in dict.fromkeys(chunk_ids) if cid not in known]
+            if new:
+                db.execute(insert(DocumentChunk), [{"content_hash": content_hash, "chunk_id": cid} for cid in new])
+    except IntegrityError:
+        # another worker registered the same file concurrently; add whatever is still missing
+        if not retry:
+            raise
+        save_document_chunks(content_hash, chunk_ids, retry=False)
+
+
 def get_recent_messages(conversation_id: int, limit: int = 6):
     db = SessionLocal()
     msgs = db.query(Message).filter(Message.conversation_id==conversation_id).order_by(Message.timestamp.desc()).limit(limit).all()
@@ -40,28 +184,22 @@ def get_recent_messages(conversation_id: int, limit: int = 6):
     return list(reversed(msgs))
 
 
+def _get_or_create_conversation_id(db, user_id) -> int:
+    lock = conversation_lock_stmt(db, user_id)
+    if lock is not None:
+        db.execute(lock)
+    new_id = db.execute(create_conversation_if_absent_stmt(user_id)).scalar()
+    # Otherwise get latest conversation for this user
+    return new_id or db.execute(latest_conversation_stmt(user_id)).scalar()
+
+
 def get_or_create_conversation(user_id: int):
-    db = SessionLocal()
-    try:
-        # Get latest conversation for this user
-        conversation = (
-            db.query(Conversation)
-            .filter(Conversation.user_id == user_id)
-            .order_by(Conversation.created_at.desc())
-            .first()
-        )
+    cached = cached_conversation_id(user_id)
+    if cached is not None:
+        return cached
 
-        # If no conversation exists, create one
-        if not conversation:
-            conversation = Conversation(
-                user_id=user_id,
-                title="Chat Session",
-                created_at = datetime.utcnow()
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-
-        return conversation.id
-    finally:
-        db.close()
\ No newline at end of file
+    with session_scope("get_or_create_conversation") as db:
+        conversation_id = _get_or_create_conversation_id(db, user_id)
+
+    remember_conversation(user_id, conversation_id)
+    return conversation_id
@@ -0,0 +1,166 @@
+# app/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.db")
+# Max cached vectors; least recently used entries are evicted past this
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+# Cache hits whose recency is held in memory until the next write
+EMBED_CACHE_TOUCH_BUFFER = int(os.getenv("EMBED_CACHE_TOUCH_BUFFER", "50000"))
+# Set EMBED_CACHE=0 to always recompute embeddings
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1") != "0"
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store keyed by (model name, sha256(text)), float32 blobs
+    in SQLite. Size-bounded with approximate LRU eviction; tracks hit/miss counts.
+
+    Reads run on per-thread connections (WAL lets them proceed during writes)
+    and never write: hits are noted in memory and their recency is written with
+    the next put_many, which is the only place eviction needs it.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()  # writer connection: inserts, recency, eviction
+        self._stats_lock = threading.Lock()  # counters and pending recency updates
+        self._conn = None
+        self._local = threading.local()
+        self._readers = []
+        self._touched = {}  # (model, key) -> time of last hit, not yet written
+        self._entries = 0
+        self._inserted_since_count = 0
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT,
+                key TEXT,
+                vector BLOB,
+                last_used REAL,
+                PRIMARY KEY (model, key)
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            self._entries = self._count(conn)
+            self._conn = conn
+        return self._conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                self._connect()  # creates the table on first use
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+            with self._stats_lock:
+                self._readers.append(conn)
+        return conn
+
+    @staticmethod
+    def _count(conn) -> int:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, keys: list[str]) -> dict:
+        """Return {key: vector} for the cached keys; recency is recorded in memory."""
+        found = {}
+        conn = self._reader()
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):  # stay under SQLite's variable limit
+            batch = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE model=? AND key IN ({','.join('?' * len(batch))})",
+                [model, *batch],
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        now = time.time()
+        hit = sum(1 for key in keys if key in found)
+        with self._stats_lock:
+            self.hits += hit
+            self.misses += len(keys) - hit
+            for key in found:
+                # bounded: past the limit further hits are simply not recorded
+                if len(self._touched) < EMBED_CACHE_TOUCH_BUFFER or (model, key) in self._touched:
+                    self._touched[(model, key)] = now
+        return found
+
+    def _write_recency(self, conn):
+        with self._stats_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany("UPDATE embeddings SET last_used=? WHERE model=? AND key=?",
+                             [(t, model, key) for (model, key), t in touched.items()])
+
+    def put_many(self, model: str, keys: list[str], vectors):
+        now = time.time()
+        rows = [(model, key, np.asarray(vec, dtype=np.float32).tobytes(), now) for key, vec in zip(keys, vectors)]
+        with self._lock:
+            conn = self._connect()
+            self._write_recency(conn)
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)", rows)
+            inserted = conn.total_changes - before
+            self._entries += inserted
+            self._inserted_since_count += inserted
+            # other workers share the file: recount before evicting, and every
+            # 10% of the bound so their inserts don't go unnoticed
+            if self._entries > self.max_entries or self._inserted_since_count > self.max_entries // 10:
+                self._entries = self._count(conn)
+                self._inserted_since_count = 0
+            if self._entries > self.max_entries:
+                # evict down to 90% of the bound so eviction isn't paid on every insert
+                excess = self._entries - int(self.max_entries * 0.9)
+                conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._entries -= excess
+                self.evictions += excess
+            conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._write_recency(self._conn)
+                self._conn.commit()
+                self._conn.close()
+            self._conn = None
+            with self._stats_lock:
+                readers, self._readers = self._readers, []
+            for conn in readers:
+                conn.close()
+            self._local = threading.local()
+
+
+embedding_cache = EmbeddingCache()
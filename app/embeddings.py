@@ -1,13 +1,158 @@
 # app/embeddings.py
-from sentence_transformers import SentenceTransformer
+import os
+import threading
 import numpy as np
+from cachetools import TTLCache
+from .embedding_cache import embedding_cache, text_key, EMBED_CACHE_ENABLED
 
 # choose a small, fast model for embeddings; swap for a larger model if needed
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-_model = SentenceTransformer(EMBED_MODEL_NAME)
+# Texts per forward pass when embedding in bulk; bounds peak tensor memory
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# In-process LRU/TTL cache for query embeddings (repeated questions skip the model)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_EMBED_CACHE_TTL", "3600"))
 
+# Single model instance per worker, shared by ingestion, chat retrieval and vectorstore.
+# Loaded lazily (or by warmup() from the app lifespan) so importing the package stays cheap.
+_model = None
+_model_lock = threading.Lock()
+_warm = False
+_counter = None  # private tokenizer copy for count_tokens, see _counting_tokenizer()
 
-def embed_texts(texts: list[str]) -> list:
-    # returns numpy array of shape (len(texts), dim)
-    embs = _model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-    return embs
\ No newline at end of file
+_query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+_query_cache_lock = threading.Lock()
+_query_stats = {"hits": 0, "misses": 0}
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                # heavy import (torch) deferred until the model is actually needed
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBED_MODEL_NAME)
+    return _model
+
+
+def warmup():
+    """Load the model and run a dummy encode so the first request doesn't pay for kernel setup."""
+    global _warm
+    encode(["warmup"])
+    _warm = True
+
+
+def is_ready() -> bool:
+    return _warm
+
+
+def encode(texts: list[str]) -> np.ndarray:
+    return get_model().encode(
+        texts, batch_size=EMBED_BATCH_SIZE, show_progress_bar=False, convert_to_numpy=True
+    )
+
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    # returns numpy array of shape (len(texts), dim); cached vectors are reused,
+    # only misses go through the model
+    if not EMBED_CACHE_ENABLED or not texts:
+        return encode(texts)
+    keys = [text_key(t) for t in texts]
+    cached = embedding_cache.get_many(EMBED_MODEL_NAME, keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        fresh = encode([texts[i] for i in missing])
+        embedding_cache.put_many(EMBED_MODEL_NAME, [keys[i] for i in missing], fresh)
+        for i, vec in zip(missing, fresh):
+            cached[keys[i]] = vec
+    return np.stack([cached[key] for key in keys]).astype(np.float32, copy=False)
+
+
+def embed_batches(texts: list[str], batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Embed texts in bounded batches of similar length, yielding
+    (indices, embeddings) per batch so callers can stream results onward.
+    Sorting by length first keeps padding within each batch small.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        yield indices, embed_texts([texts[i] for i in indices])
+
+
+def _counting_tokenizer():
+    # Counting needs truncation off while encode() needs it on. transformers sets
+    # truncation on the shared Rust tokenizer and encodes in a separate step, so
+    # sharing one instance across threads leaks each caller's setting into the
+    # other's call. Counting uses its own copy, configured once and never changed.
+    global _counter
+    if _counter is None:
+        with _model_lock:
+            if _counter is None:
+                from tokenizers import Tokenizer
+                counter = Tokenizer.from_str(get_model().tokenizer.backend_tokenizer.to_str())
+                counter.no_truncation()
+                counter.no_padding()
+                _counter = counter
+    return _counter
+
+
+def count_tokens(texts: list[str]) -> list[int]:
+    """Token counts under the embedding model's own tokenizer (no special tokens)."""
+    if not texts:
+        return []
+    encoded = _counting_tokenizer().encode_batch(texts, add_special_tokens=False)
+    return [len(e.ids) for e in encoded]
+
+
+def max_input_tokens() -> int:
+    """Longest input the model embeds without truncation, minus [CLS]/[SEP]."""
+    return get_model().max_seq_length - 2
+
+
+def normalize_query(text: str) -> str:
+    # MiniLM's tokenizer is uncased and whitespace-insensitive, so this doesn't change the vector
+    return " ".join(text.lower().split())
+
+
+def embed_query(text: str) -> list[float]:
+    """Embed a single query string for Chroma's query_embeddings, via the LRU/TTL cache."""
+    key = normalize_query(text)
+    with _query_cache_lock:
+        embedding = _query_cache.get(key)
+        _query_stats["hits" if embedding is not None else "misses"] += 1
+    if embedding is None:
+        embedding = embed_texts([key])[0].tolist()
+        with _query_cache_lock:
+            _query_cache[key] = embedding
+    return embedding
+
+
+def query_cache_stats() -> dict:
+    with _query_cache_lock:
+        lookups = _query_stats["hits"] + _query_stats["misses"]
+        return {
+            **_query_stats,
+            "hit_rate": round(_query_stats["hits"] / lookups, 4) if lookups else 0.0,
+            "size": len(_query_cache),
+            "maxsize": QUERY_CACHE_SIZE,
+            "ttl": QUERY_CACHE_TTL,
+        }
+
+
+def memory_footprint() -> dict:
+    """Report the resident size of the shared model's weights and buffers."""
+    if _model is None:
+        return {"model": EMBED_MODEL_NAME, "loaded": False}
+    params = sum(p.numel() * p.element_size() for p in _model.parameters())
+    buffers = sum(b.numel() * b.element_size() for b in _model.buffers())
+    return {
+        "model": EMBED_MODEL_NAME,
+        "loaded": True,
+        "warm": _warm,
+        "dim": _model.get_sentence_embedding_dimension(),
+        "device": str(_model.device),
+        "bytes": params + buffers,
+        "mb": round((params + buffers) / (1024 * 1024), 1),
+    }
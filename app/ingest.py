@@ -1,106 +1,210 @@
 # app/ingest.py
 import os
-import sqlite3
+import hashlib
+import logging
 from uuid import uuid4
-from fastapi import APIRouter, File, UploadFile, Form, Depends
+from functools import partial
+from fastapi import APIRouter, File, UploadFile, Form, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-from chromadb.utils import embedding_functions
-from .db import get_collection
+from starlette.concurrency import run_in_threadpool
+from .db import get_collection, get_chroma_client, visibility_key
+from .embeddings import embed_batches, count_tokens, max_input_tokens
+from .pdf_extract import extract_pages, count_pages
+from .jobs import IngestJob, ingest_queue
+from .bulk_writer import BulkWriter, CHROMA_WRITE_BATCH
+from .db_helpers import indexed_chunk_ids, save_document_chunks
+from . import db_async
+from .answer_cache import answer_cache
+from .semantic_cache import semantic_cache
+from .schemas import IngestJobStatus
+from .utils import clean_text, chunk_by_tokens
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-DB_PATH = "rag_history.db"
-
-# Ensure DB exists
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Stores conversation history
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS chat_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT,
-        role TEXT,
-        content TEXT
-    )
-    """)
-    # Stores uploaded docs
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS documents (
-        id TEXT PRIMARY KEY,
-        user_id TEXT,
-        filename TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
+UPLOAD_DIR = "uploaded_files"
+
+# Uploads are streamed to disk in UPLOAD_CHUNK_SIZE pieces and capped at MAX_UPLOAD_MB
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Chunk size in embedding-model tokens (0 = the model's window) and overlap between chunks
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+
+def upload_too_large(content_length) -> bool:
+    """Early check on the request's Content-Length, before the body is read."""
+    try:
+        return content_length is not None and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE
+    except ValueError:
+        return False
+
+
+async def save_upload(file: UploadFile, dest_path: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Stream an upload to dest_path in fixed-size chunks, hashing as it goes.
+    Writes to a .part file and renames on success; raises 413 past max_bytes.
+    Returns (size_in_bytes, sha256_hex).
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_path + ".part"
+    out = open(tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        out.close()
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        out.close()
+        os.remove(tmp_path)
+        raise
+    return size, digest.hexdigest()
+
+
+def chunk_id(text: str) -> str:
+    # Content-addressed: identical chunk text maps to the same vector store entry
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def grant_visibility(collection, ids: list[str], user_id: str):
+    """Make already-indexed chunks visible to user_id (Chroma merges metadata on update)."""
+    for i in range(0, len(ids), CHROMA_WRITE_BATCH):
+        batch = ids[i:i + CHROMA_WRITE_BATCH]
+        collection.update(ids=batch, metadatas=[{visibility_key(user_id): True} for _ in batch])
 
-init_db()
 
-# Embeddings function (change model if needed)
-embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
+def chunk_pages(pages: list[str]) -> dict:
+    """
+    Chunking stage: clean each page and split it into sentence-aligned chunks
+    that fit the embedding model's window. Returns {chunk_id: (text, page)},
+    deduplicated and in document order.
+    """
+    max_tokens = min(CHUNK_MAX_TOKENS or max_input_tokens(), max_input_tokens())
+    chunks = {}
+    for page_no, page in enumerate(pages, start=1):
+        if not page:
+            continue
+        for text in chunk_by_tokens(clean_text(page), count_tokens, max_tokens, CHUNK_OVERLAP_TOKENS):
+            chunks.setdefault(chunk_id(text), (text, page_no))
+    return chunks
 
-@router.post("/upload_pdf")
+
+def ingest_document(job: IngestJob, collection):
+    """Job handler: index the upload, then drop the user's cached answers."""
+    try:
+        index_document(job, collection)
+    finally:
+        answer_cache.invalidate_user(job.user_id)
+        semantic_cache.invalidate_user(job.user_id)
+
+
+def index_document(job: IngestJob, collection):
+    """Parse, embed and index one uploaded PDF, skipping known content."""
+    # Same file already ingested (by anyone): no parsing or embedding, only visibility
+    known = indexed_chunk_ids(job.content_hash)
+    if known:
+        job.deduplicated = True
+        job.chunks_total = job.chunks_reused = len(known)
+        grant_visibility(collection, known, job.user_id)
+        return
+
+    job.pages_total = count_pages(job.file_path)
+
+    # Extract text from PDF (page ranges in parallel worker processes)
+    def on_pages(done):
+        job.pages_processed = done
+    pages = extract_pages(job.file_path, progress=on_pages)
+    chunks = chunk_pages(pages)
+    job.chunks_total = len(chunks)
+    if not chunks:
+        return
+
+    # Chunks already in the store (from other documents) only need visibility
+    existing = set(collection.get(ids=list(chunks), include=[])["ids"])
+    job.chunks_reused = len(existing)
+
+    new_ids = [cid for cid in chunks if cid not in existing]
+    if new_ids:
+        new_chunks = [chunks[cid][0] for cid in new_ids]
+        # Embed in length-sorted, bounded batches; the bulk writer flushes to Chroma
+        # in CHROMA_WRITE_BATCH records as embeddings arrive
+        def on_flush(n):
+            job.chunks_written += n
+        with BulkWriter(collection, client=get_chroma_client(), on_flush=on_flush) as writer:
+            for indices, embeddings in embed_batches(new_chunks):
+                ids = [new_ids[i] for i in indices]
+                writer.add(
+                    ids=ids,
+                    documents=[new_chunks[i] for i in indices],
+                    embeddings=embeddings.tolist(),
+                    metadatas=[
+                        {"user_id": job.user_id, "doc_hash": job.content_hash, "page": chunks[cid][1],
+                         visibility_key(job.user_id): True}
+                        for cid in ids
+                    ]
+                )
+                job.chunks_embedded += len(ids)
+        job.write_stats = writer.stats()
+        logger.info("Indexed %s: %s", job.filename, job.write_stats)
+
+    # Grant visibility on every chunk after writing, not just the ones found in
+    # `existing`: a concurrent job may have written the same chunk ids between
+    # that check and our writes, with metadata carrying only its own user
+    grant_visibility(collection, list(chunks), job.user_id)
+    save_document_chunks(job.content_hash, list(chunks))
+
+
+@router.post("/upload_pdf", status_code=202)
 async def upload_pdf(
     file: UploadFile = File(...),
     user_id: str = Form(...),
     collection=Depends(get_collection)
 ):
     file_id = str(uuid4())
-    file_path = f"uploaded_files/{file.filename}"
-    os.makedirs("uploaded_files", exist_ok=True)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    # Files are stored once per content hash, whatever name they were uploaded under
+    tmp_path = os.path.join(UPLOAD_DIR, f"{file_id}.upload")
+    size, content_hash = await save_upload(file, tmp_path)
+    file_path = os.path.join(UPLOAD_DIR, f"{content_hash}.pdf")
+    if os.path.exists(file_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, file_path)
 
     # Save doc metadata to DB
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("INSERT INTO documents (id, user_id, filename) VALUES (?, ?, ?)",
-                 (file_id, user_id, file.filename))
-    conn.commit()
-    conn.close()
-
-    # Extract text from PDF
-    pdf = PdfReader(file_path)
-    chunks = []
-    for page in pdf.pages:
-        text = page.extract_text()
-        if text:
-            chunks.append(text)
-
-    # Store in Chroma
-    collection.add(
-        documents=chunks,
-        ids=[f"{file_id}_{i}" for i in range(len(chunks))],
-        embeddings=embedding_func(chunks),
-        metadatas=[{"user_id": user_id} for _ in chunks]
+    await db_async.register_document(file_id, user_id, file.filename, content_hash)
+
+    # Parsing, embedding and indexing happen on the ingestion worker pool
+    job = ingest_queue.submit(
+        IngestJob(user_id, file.filename, file_path, content_hash=content_hash, size_bytes=size),
+        partial(ingest_document, collection=collection),
+    )
+    return JSONResponse(
+        status_code=202,
+        content={"status": "queued", "job_id": job.id, "message": f"{file.filename} queued for ingestion"},
     )
 
-    return JSONResponse({"status": "success", "message": f"{file.filename} ingested"})
-
-def save_message(user_id: str, role: str, content: str):
-    """Save a message to chat history."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)",
-                 (user_id, role, content))
-    conn.commit()
-    conn.close()
-
-def get_history(user_id: str, limit: int = 10):
-    """Retrieve last N messages for a user."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT role, content FROM chat_history
-        WHERE user_id=? ORDER BY id DESC LIMIT ?
-    """, (user_id, limit))
-    rows = c.fetchall()
-    conn.close()
-    # Return in reverse (oldest first)
-    return [{"role": r, "content": c} for r, c in reversed(rows)]
+
+@router.get("/ingest/jobs/{job_id}", response_model=IngestJobStatus)
+def ingest_job_status(job_id: str):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return job.to_dict()
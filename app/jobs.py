@@ -0,0 +1,120 @@
+# app/jobs.py
+import os
+import time
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrent ingestion jobs per worker process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Finished jobs kept for status polling before the oldest are forgotten
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class IngestJob:
+    def __init__(self, user_id: str, filename: str, file_path: str, content_hash: str = None, size_bytes: int = 0):
+        self.id = str(uuid4())
+        self.user_id = user_id
+        self.filename = filename
+        self.file_path = file_path
+        self.content_hash = content_hash
+        self.size_bytes = size_bytes
+        self.state = QUEUED
+        self.error = None
+        self.pages_total = 0
+        self.pages_processed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.chunks_written = 0  # flushed to the vector store
+        self.write_stats = {}
+        self.chunks_reused = 0  # already in the vector store, not re-embedded
+        self.deduplicated = False  # whole file already ingested
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def throughput(self) -> float:
+        """Chunks embedded per second since the job started."""
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.chunks_embedded / elapsed, 2) if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "filename": self.filename,
+            "content_hash": self.content_hash,
+            "size_bytes": self.size_bytes,
+            "state": self.state,
+            "error": self.error,
+            "pages_total": self.pages_total,
+            "pages_processed": self.pages_processed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_written": self.chunks_written,
+            "write_stats": self.write_stats,
+            "chunks_reused": self.chunks_reused,
+            "deduplicated": self.deduplicated,
+            "chunks_per_sec": self.throughput(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """In-process job registry backed by a bounded worker thread pool."""
+
+    def __init__(self, workers: int = INGEST_WORKERS, history: int = INGEST_JOB_HISTORY):
+        self._executor = None
+        self._workers = workers
+        self._history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: IngestJob, handler) -> IngestJob:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="ingest")
+            self._jobs[job.id] = job
+            self._evict()
+            self._executor.submit(self._run, job, handler)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job: IngestJob, handler):
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            handler(job)
+            job.state = SUCCEEDED
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _evict(self):
+        # Drop the oldest finished jobs once the registry is over its bound
+        excess = len(self._jobs) - self._history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.state in (SUCCEEDED, FAILED)][:excess]:
+            del self._jobs[job_id]
+
+
+ingest_queue = JobQueue()
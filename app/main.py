@@ -1,22 +1,72 @@
 # app/main.py
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import anyio.to_thread
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 from . import chat
 from . import ingest
+from .db import engine, db_health, open_chroma, close_chroma, chroma_health
+from .embeddings import memory_footprint, warmup, is_ready, query_cache_stats
+from .pdf_extract import shutdown_pool
+from .jobs import ingest_queue
+from .embedding_cache import embedding_cache
+from .answer_cache import answer_cache
+from .semantic_cache import semantic_cache
+from .migrations import migrate_all
+from .write_behind import message_writer
+from .db_helpers import op_stats
+from .db_async import async_engine
 
 # Load environment variables
 load_dotenv()
 
+# Set EMBED_WARMUP=0 to skip eager model loading (the model then loads on first use)
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "1") != "0"
+
+# Threads available for blocking work (Chroma, embeddings, SQLite) per worker
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Schema changes (indexes etc.) for databases created by older versions
+    await run_in_threadpool(migrate_all)
+    # Open the vector store once per worker; requests reuse the handle
+    open_chroma()
+    if EMBED_WARMUP:
+        await run_in_threadpool(warmup)
+    await message_writer.start()
+    yield
+    await message_writer.stop()
+    ingest_queue.shutdown()
+    shutdown_pool()
+    embedding_cache.close()
+    engine.dispose()
+    await async_engine.dispose()
+    close_chroma()
+
+
 app = FastAPI(
     title="RAG Chatbot with ChromaDB + Groq",
     description="Upload PDFs, ingest into Chroma, and chat using Groq's LLaMA model",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-# Allow CORS for frontend dev
+# Reject oversized uploads from Content-Length before the multipart body is read
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.url.path == "/upload_pdf" and ingest.upload_too_large(request.headers.get("content-length")):
+        return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
+# Allow CORS for frontend dev (added last so it wraps every response)
 app.add_middleware(
     CORSMiddleware,
     # allow_origins=["*"],  # change to your frontend URL in production
@@ -33,3 +83,33 @@ app.include_router(chat.router, tags=["Chat"])
 @app.get("/")
 def root():
     return {"message": "RAG Chatbot API is running"}
+
+
+@app.get("/health")
+def health():
+    return {"chroma": chroma_health(), "database": db_health(), "embeddings": memory_footprint()}
+
+
+@app.get("/ready")
+def ready():
+    # Readiness for the load balancer: vector store open and embedding model warm
+    chroma = chroma_health()
+    warm = is_ready() or not EMBED_WARMUP
+    if chroma["status"] != "ok" or not warm:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "chroma": chroma["status"], "embeddings_warm": warm},
+        )
+    return {"ready": True}
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "query_embedding_cache": query_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "database": op_stats(),
+        "message_writer": message_writer.stats(),
+    }
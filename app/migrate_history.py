@@ -0,0 +1,72 @@
+# app/migrate_history.py
+"""
+One-off import of the legacy rag_history.db (raw sqlite3 chat_history /
+documents / document_chunks tables) into the unified app database.
+
+    python -m app.migrate_history [path/to/rag_history.db]
+
+The source file is renamed to <name>.migrated afterwards so the import
+cannot run twice.
+"""
+import os
+import sys
+import sqlite3
+from sqlalchemy import insert, select
+from .db import Message, Document
+from .migrations import migrate_all
+from .db_helpers import session_scope, get_or_create_conversation, save_document_chunks
+
+LEGACY_DB_PATH = "rag_history.db"
+
+
+def migrate(path: str = LEGACY_DB_PATH) -> dict:
+    src = sqlite3.connect(path)
+    tables = {r[0] for r in src.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    counts = {"messages": 0, "documents": 0, "document_chunks": 0}
+
+    if "chat_history" in tables:
+        # chat() stored the conversation id in chat_history.user_id; older rows
+        # may hold a real user id, which is mapped to that user's conversation
+        rows = src.execute("SELECT user_id, role, content FROM chat_history ORDER BY id").fetchall()
+        messages = []
+        for owner, role, content in rows:
+            owner = str(owner)
+            conversation_id = int(owner) if owner.isdigit() else get_or_create_conversation(owner)
+            messages.append({"conversation_id": conversation_id, "role": role, "content": content})
+        if messages:
+            with session_scope("migrate_messages") as db:
+                db.execute(insert(Message), messages)
+        counts["messages"] = len(messages)
+
+    if "documents" in tables:
+        columns = [r[1] for r in src.execute("PRAGMA table_info(documents)")]
+        hash_col = "content_hash" if "content_hash" in columns else "NULL"
+        rows = src.execute(f"SELECT id, user_id, filename, {hash_col} FROM documents").fetchall()
+        with session_scope("migrate_documents") as db:
+            known = set(db.execute(select(Document.id)).scalars())
+            new = [r for r in rows if r[0] not in known]
+            if new:
+                db.execute(insert(Document), [
+                    {"id": i, "user_id": u, "filename": f, "content_hash": h} for i, u, f, h in new
+                ])
+        counts["documents"] = len(new)
+
+    if "document_chunks" in tables:
+        by_hash = {}
+        for content_hash, chunk_id in src.execute("SELECT content_hash, chunk_id FROM document_chunks"):
+            by_hash.setdefault(content_hash, []).append(chunk_id)
+        for content_hash, chunk_ids in by_hash.items():
+            save_document_chunks(content_hash, chunk_ids)
+            counts["document_chunks"] += len(chunk_ids)
+
+    src.close()
+    os.replace(path, path + ".migrated")
+    return counts
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else LEGACY_DB_PATH
+    if not os.path.exists(path):
+        sys.exit(f"{path} not found; nothing to migrate")
+    migrate_all()
+    print(migrate(path))
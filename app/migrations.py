@@ -0,0 +1,76 @@
+# app/migrations.py
+import time
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema changes for the app database (app/db.py), applied in order at
+# startup and recorded in schema_migrations. Append new entries; never edit applied ones.
+MIGRATIONS = [
+    (1, "index messages (conversation_id, timestamp) for get_recent_messages", [
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_ts ON messages (conversation_id, timestamp)",
+    ]),
+    (2, "index conversations (user_id, created_at) for get_or_create_conversation", [
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_created ON conversations (user_id, created_at)",
+    ]),
+]
+
+
+def apply_migrations(conn, migrations=MIGRATIONS) -> list[int]:
+    """Apply pending migrations on a SQLAlchemy connection; returns the versions applied."""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at REAL
+    )
+    """))
+    done = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    applied = []
+    for version, name, statements in migrations:
+        if version in done:
+            continue
+        for statement in statements:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                     {"v": version, "n": name, "t": time.time()})
+        conn.commit()
+        logger.info("Applied migration %d: %s", version, name)
+        applied.append(version)
+    return applied
+
+
+# pg_advisory_lock key serializing schema changes across workers/replicas
+MIGRATION_LOCK_ID = 7215001
+
+
+def migrate_all() -> list[int]:
+    """Bring the app database up to date; called from the app lifespan."""
+    from .db import engine, Base
+
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            Base.metadata.create_all(bind=conn)
+            conn.commit()
+            return apply_migrations(conn)
+        finally:
+            if postgres:
+                release_migration_lock(conn)
+
+
+def release_migration_lock(conn):
+    # A failed DDL statement leaves the transaction aborted and Postgres rejects
+    # everything until rollback, the unlock included; roll back first so the
+    # original error surfaces. If the unlock still fails, discard the connection:
+    # the session-level lock goes with it instead of back into the pool.
+    try:
+        conn.rollback()
+        conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+        conn.commit()
+    except Exception:
+        logger.exception("Could not release the migration lock; discarding the connection")
+        conn.invalidate()
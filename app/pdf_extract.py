@@ -0,0 +1,86 @@
+# app/pdf_extract.py
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+
+# Worker processes for page text extraction (CPU/GIL bound); 1 disables the pool
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages, spawning work across processes costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the pool is created from a worker thread of a
+            # multithreaded server, and a forked child can inherit locks held
+            # by other threads (logging, tokenizers, torch) and deadlock on them
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def _extract_range(file_path: str, start: int, end: int) -> list[str]:
+    # Runs in a worker process: each worker opens its own reader
+    pdf = PdfReader(file_path)
+    return [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def page_ranges(num_pages: int, parts: int) -> list[tuple[int, int]]:
+    """Split [0, num_pages) into at most `parts` contiguous, near-equal ranges."""
+    parts = max(1, min(parts, num_pages))
+    size, extra = divmod(num_pages, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def count_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def extract_pages(file_path: str, workers: int | None = None, progress=None) -> list[str]:
+    """
+    Extract the text of every page, in page order ("" for pages without text).
+    Large documents are split into page ranges across the process pool.
+    `progress(pages_done)` is called as page ranges complete.
+    """
+    workers = workers or PDF_EXTRACT_WORKERS
+    num_pages = count_pages(file_path)
+    if workers <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+        pages = _extract_range(file_path, 0, num_pages)
+        if progress:
+            progress(len(pages))
+        return pages
+
+    pool = get_pool()
+    futures = [
+        pool.submit(_extract_range, file_path, start, end)
+        for start, end in page_ranges(num_pages, workers)
+    ]
+    pages = []
+    for future in futures:  # submitted in range order, so pages stay ordered
+        pages.extend(future.result())
+        if progress:
+            progress(len(pages))
+    return pages
@@ -0,0 +1,100 @@
+# app/prompt_budget.py
+import os
+import math
+
+# Groq doesn't expose the Llama tokenizer; ~4 characters per token is a close,
+# cheap estimate for English text and errs slightly on the generous side
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+# Tokens per request, prompt plus answer; RESPONSE_TOKEN_RESERVE of it is kept
+# for the answer and the rest is the prompt budget
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+RESPONSE_TOKEN_RESERVE = int(os.getenv("RESPONSE_TOKEN_RESERVE", "1024"))
+# Most of the prompt budget (after system prompt and question) history may use
+HISTORY_BUDGET_SHARE = float(os.getenv("HISTORY_BUDGET_SHARE", "0.3"))
+# A chunk is truncated to fit only if at least this many tokens of it survive
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", "64"))
+
+# Per-message overhead of the chat format (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    cut = text[:int(tokens * CHARS_PER_TOKEN)]
+    # don't end mid-word
+    space = cut.rfind(" ")
+    return cut[:space] if space > len(cut) // 2 else cut
+
+
+def fit_history(history: list[dict], budget: int):
+    """Keep the newest messages that fit; returns (kept, tokens)."""
+    kept, used = [], 0
+    for msg in reversed(history):
+        n = count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if used + n > budget:
+            break
+        kept.append(msg)
+        used += n
+    kept.reverse()
+    return kept, used
+
+
+def fit_chunks(chunks: list[str], budget: int):
+    """
+    Take chunks in rank order while they fit; the first that doesn't is
+    truncated if enough of it survives, and everything ranked below is dropped.
+    Returns (kept, tokens, truncated).
+    """
+    kept, used, truncated = [], 0, 0
+    for chunk in chunks:
+        n = count_tokens(chunk) + 1  # joining newline
+        if used + n <= budget:
+            kept.append(chunk)
+            used += n
+            continue
+        remaining = budget - used - 1
+        if remaining >= MIN_CHUNK_TOKENS:
+            kept.append(truncate_to_tokens(chunk, remaining))
+            used += count_tokens(kept[-1]) + 1
+            truncated = 1
+        break
+    return kept, used, truncated
+
+
+def build_prompt(system_prompt: str, history: list[dict], chunks: list[str], question: str,
+                 budget: int = PROMPT_TOKEN_BUDGET - RESPONSE_TOKEN_RESERVE):
+    """
+    Assemble the Groq message list within `budget` tokens. The system prompt and
+    question are always sent; the newest history that fits in
+    HISTORY_BUDGET_SHARE of the rest goes next, and context chunks get every
+    token history didn't use. Returns (messages, report) with the token split.
+    """
+    def user_content(context):
+        return f"Context:\n{context}\n\nQuestion: {question}"
+
+    fixed = (count_tokens(system_prompt) + count_tokens(user_content(""))
+             + 2 * MESSAGE_OVERHEAD_TOKENS)
+    available = max(0, budget - fixed)
+
+    kept_history, history_tokens = fit_history(history, int(available * HISTORY_BUDGET_SHARE))
+    kept_chunks, context_tokens, truncated = fit_chunks(chunks, available - history_tokens)
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(kept_history)
+    messages.append({"role": "user", "content": user_content("\n".join(kept_chunks))})
+
+    report = {
+        "budget": budget,
+        "total": fixed + history_tokens + context_tokens,
+        "fixed": fixed,
+        "history": history_tokens,
+        "history_dropped": len(history) - len(kept_history),
+        "context": context_tokens,
+        "chunks_used": len(kept_chunks),
+        "chunks_dropped": len(chunks) - len(kept_chunks),
+        "chunks_truncated": truncated,
+    }
+    return messages, report
@@ -1,6 +1,6 @@
 # app/schemas.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 
 class UploadResponse(BaseModel):
     status: str
@@ -14,4 +14,28 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     answer: str
-    conversation_id: int
\ No newline at end of file
+    conversation_id: int
+    timings: Dict[str, float] = {}  # per-stage latency in ms
+    cache: Optional[str] = None  # set when the answer was served from a cache
+    prompt: Dict[str, int] = {}  # prompt token budget: size per section, dropped history/chunks
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    user_id: str
+    filename: str
+    content_hash: Optional[str] = None
+    size_bytes: int = 0
+    state: str  # queued | running | succeeded | failed
+    error: Optional[str] = None
+    pages_total: int
+    pages_processed: int
+    chunks_total: int
+    chunks_embedded: int
+    chunks_written: int = 0
+    write_stats: Dict[str, float] = {}  # bulk writer flushes, retries, chunks/sec
+    chunks_reused: int = 0
+    deduplicated: bool = False
+    chunks_per_sec: float
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
@@ -0,0 +1,160 @@
+# app/semantic_cache.py
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Cosine similarity above which a previous question counts as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Minimum Jaccard overlap between the cached and current retrieved chunks
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.5"))
+SEMANTIC_CACHE_PER_USER = int(os.getenv("SEMANTIC_CACHE_PER_USER", "256"))
+SEMANTIC_CACHE_USERS = int(os.getenv("SEMANTIC_CACHE_USERS", "1024"))
+# Set SEMANTIC_CACHE=0 to disable
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "1") != "0"
+
+
+# Questions this short, or referring back to the conversation, are follow-ups
+SEMANTIC_CACHE_FOLLOW_UP_WORDS = int(os.getenv("SEMANTIC_CACHE_FOLLOW_UP_WORDS", "3"))
+_FOLLOW_UP = re.compile(
+    r"\b(it|its|it's|this|that|these|those|they|them|their|he|she|him|her|"
+    r"more|again|above|previous|earlier|same|else|instead|also|"
+    r"what about|how about|and what|why not|example|examples)\b"
+)
+
+
+def is_follow_up(question: str) -> bool:
+    """Whether a question depends on the conversation before it (pronouns, "tell me more", ...)."""
+    q = question.lower()
+    return len(q.split()) <= SEMANTIC_CACHE_FOLLOW_UP_WORDS or bool(_FOLLOW_UP.search(q))
+
+
+def context_key(question: str, history: list[dict]) -> str:
+    """
+    "" for a standalone question; for a follow-up, a digest of the last exchange
+    in the history sent with it, so it only matches follow-ups to that exchange.
+    """
+    if not is_follow_up(question) or not history:
+        return ""
+    last_turn = [(m["role"], m["content"]) for m in history[-2:]]
+    return hashlib.sha256(json.dumps(last_turn).encode("utf-8")).hexdigest()
+
+
+class _UserIndex:
+    """Small per-user index: a row-normalized matrix of past question embeddings."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.answers = []
+        self.chunk_ids = []
+        self.contexts = []
+
+    def add(self, vector, answer: str, chunk_ids, context: str):
+        self.vectors = np.vstack([self.vectors, vector[None, :]])[-SEMANTIC_CACHE_PER_USER:]
+        self.answers = (self.answers + [answer])[-SEMANTIC_CACHE_PER_USER:]
+        self.chunk_ids = (self.chunk_ids + [frozenset(chunk_ids)])[-SEMANTIC_CACHE_PER_USER:]
+        self.contexts = (self.contexts + [context])[-SEMANTIC_CACHE_PER_USER:]
+
+
+class SemanticCache:
+    """
+    Reuses an answer when a new question from the same user is a close
+    paraphrase (cosine >= threshold) of one answered before and retrieves
+    substantially the same chunks. Standalone questions match whatever was
+    said before them; follow-ups ("tell me more", "how does it work?") only
+    match follow-ups to the same last exchange, so "tell me more" about heaps
+    never gets the answer about BSTs. Dropped per user when their documents
+    change.
+
+    `false_positives` counts lookups where a paraphrase matched on the question
+    alone but was asked in a different context: answers a question-only cache
+    would have served wrongly. `retrieval_rejects` counts matches refused
+    because retrieval disagreed.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.threshold = threshold
+        self._users = OrderedDict()  # user_id -> _UserIndex, LRU over users
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.false_positives = 0
+        self.retrieval_rejects = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, user_id: str, question: str, embedding, chunk_ids, history: list[dict]):
+        """`history` is the history sent with the question (the budgeted prompt)."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        query = self._normalize(embedding)
+        context = context_key(question, history)
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None or not index.answers:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            scores = index.vectors @ query
+            similar = scores >= self.threshold
+            if not similar.any():
+                self.misses += 1
+                return None
+            same_context = np.array([c == context for c in index.contexts])
+            candidates = np.where(similar & same_context, scores, -np.inf)
+            best = int(np.argmax(candidates))
+            if candidates[best] == -np.inf:
+                self.false_positives += 1
+                self.misses += 1
+                return None
+            current, cached = frozenset(chunk_ids), index.chunk_ids[best]
+            union = current | cached
+            overlap = len(current & cached) / len(union) if union else 1.0
+            if overlap < SEMANTIC_CACHE_MIN_OVERLAP:
+                self.retrieval_rejects += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return index.answers[best]
+
+    def put(self, user_id: str, question: str, embedding, answer: str, chunk_ids, history: list[dict]):
+        if not SEMANTIC_CACHE_ENABLED or not answer:
+            return
+        vec = self._normalize(embedding)
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = _UserIndex(vec.shape[0])
+                if len(self._users) > SEMANTIC_CACHE_USERS:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+            index.add(vec, answer, chunk_ids, context_key(question, history))
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "users": len(self._users),
+                "entries": sum(len(i.answers) for i in self._users.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "false_positives": self.false_positives,
+                "retrieval_rejects": self.retrieval_rejects,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+semantic_cache = SemanticCache()
@@ -1,6 +1,11 @@
 # app/utils.py
 import re
-from typing import List
+from collections import deque
+from typing import Callable, List
+
+_WORD = re.compile(r'\S+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
 
 
 def clean_text(text: str) -> str:
@@ -10,11 +15,99 @@ def clean_text(text: str) -> str:
 
 
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
-    words = text.split()
+    # word spans into the original string, so each chunk is a single string slice
+    spans = [m.span() for m in _WORD.finditer(text)]
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for i in range(0, len(spans), step):
+        end = min(i + chunk_size, len(spans)) - 1
+        chunks.append(text[spans[i][0]:spans[end][1]])
+        if end == len(spans) - 1:
+            break
+    return chunks
+
+
+def split_sentences(text: str) -> List[tuple[str, bool]]:
+    """Split into sentences; each item is (sentence, ends_paragraph)."""
+    units = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        sentences = [' '.join(s.split()) for s in _SENTENCE_END.split(paragraph)]
+        sentences = [s for s in sentences if s]
+        for i, sentence in enumerate(sentences):
+            units.append((sentence, i == len(sentences) - 1))
+    return units
+
+
+def _split_to_fit(text: str, n: int, count_tokens, max_tokens: int) -> List[tuple[str, int]]:
+    """Split text of n tokens into (piece, tokens) pieces of at most max_tokens each."""
+    if n <= max_tokens or len(text) <= 1:
+        return [(text, n)]
+    words = len(_WORD.findall(text))
+    if words > 1:
+        per_piece = min(words - 1, max(1, words * max_tokens // n))
+        pieces = chunk_text(text, chunk_size=per_piece, overlap=0)
+    else:
+        # one "word" longer than the window (URL, hash, run-together table row): cut on characters
+        size = min(len(text) - 1, max(1, len(text) * max_tokens // n))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+    fitted = []
+    # the words-per-token estimate is only an estimate: re-split whatever still doesn't fit
+    for piece, m in zip(pieces, count_tokens(pieces)):
+        fitted.extend(_split_to_fit(piece, m, count_tokens, max_tokens))
+    return fitted
+
+
+def chunk_by_tokens(
+    text: str,
+    count_tokens: Callable[[List[str]], List[int]],
+    max_tokens: int = 254,
+    overlap_tokens: int = 32,
+) -> List[str]:
+    """
+    Pack whole sentences into chunks of at most max_tokens (as measured by
+    count_tokens, e.g. the embedding model's tokenizer), carrying up to
+    overlap_tokens of trailing sentences into the next chunk. A paragraph end
+    closes the chunk once it is at least half full. Sentences longer than
+    max_tokens are split on words (or characters, for a single overlong word)
+    until every piece fits. Linear in the input.
+    """
+    units = split_sentences(text)
+    if not units:
+        return []
+    counts = count_tokens([u[0] for u in units])
+
+    # break oversized sentences into pieces that fit the token budget
+    sized = []
+    for (sentence, para_end), n in zip(units, counts):
+        pieces = _split_to_fit(sentence, n, count_tokens, max_tokens)
+        for j, (piece, m) in enumerate(pieces):
+            sized.append((piece, m, para_end and j == len(pieces) - 1))
+
     chunks = []
-    i = 0
-    while i < len(words):
-        chunk = words[i:i+chunk_size]
-        chunks.append(' '.join(chunk))
-        i += chunk_size - overlap
-    return chunks
\ No newline at end of file
+    window = deque()  # (sentence, tokens) in the current chunk
+    total = 0
+    fresh = 0  # sentences added since the last emitted chunk
+
+    def emit():
+        chunks.append(' '.join(s for s, _ in window))
+
+    for sentence, n, para_end in sized:
+        if total + n > max_tokens:
+            if fresh:
+                emit()
+                fresh = 0
+            # keep only the trailing overlap for the next chunk, and only as much
+            # of it as leaves room for this sentence (also after a paragraph emit)
+            while window and (total > overlap_tokens or total + n > max_tokens):
+                total -= window.popleft()[1]
+        window.append((sentence, n))
+        total += n
+        fresh += 1
+        if para_end and total >= max_tokens // 2:
+            emit()
+            fresh = 0
+            while window and total > overlap_tokens:
+                total -= window.popleft()[1]
+    if fresh:
+        emit()
+    return chunks
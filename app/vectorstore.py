@@ -1,21 +1,18 @@
 # app/vectorstore.py
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-import os
-
-# Use local chroma (persist_directory optional)
-chroma_client = chromadb.Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory="./chroma_db"))
+from .db import get_chroma_client
+from .embeddings import embed_texts, embed_query
 
 COLLECTION_NAME = "rag_docs"
 
-# create or get collection
-try:
-    collection = chroma_client.get_collection(COLLECTION_NAME)
-except Exception:
-    # Use default huggingface embedding function if you want chroma to handle embeddings;
-    # but since we compute embeddings ourselves with sentence-transformers, we will upsert embeddings directly.
-    collection = chroma_client.create_collection(name=COLLECTION_NAME)
+
+def get_collection():
+    """
+    The rag_docs collection on the process-wide persistent client, opened on
+    first use so importing this module has no side effects on the store.
+    We compute embeddings ourselves with sentence-transformers and upsert them
+    directly, so the collection needs no embedding function.
+    """
+    return get_chroma_client().get_or_create_collection(name=COLLECTION_NAME)
 
 
 def upsert_documents(docs: list[dict]):
@@ -24,12 +21,26 @@ def upsert_documents(docs: list[dict]):
     embeddings = [d['embedding'] for d in docs]
     metadatas = [d['metadata'] for d in docs]
     documents = [d['metadata'].get('text', '') for d in docs]
-    collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+    get_collection().add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+
+def upsert_texts(ids: list[str], texts: list[str], metadatas: list[dict]):
+    # embeds with the shared model, then stores the text alongside the metadata
+    embeddings = embed_texts(texts).tolist()
+    docs = [
+        {'id': _id, 'embedding': emb, 'metadata': {**meta, 'text': text}}
+        for _id, emb, meta, text in zip(ids, embeddings, metadatas, texts)
+    ]
+    upsert_documents(docs)
+
+
+def query_text(text: str, top_k: int = 4):
+    return query_vectors(embed_query(text), top_k=top_k)
 
 
 def query_vectors(query_embedding, top_k: int = 4):
     # returns list of matches with metadata and score
-    res = collection.query(query_embeddings=[query_embedding], n_results=top_k, include=['metadatas', 'distances', 'documents'])
+    res = get_collection().query(query_embeddings=[query_embedding], n_results=top_k, include=['metadatas', 'distances', 'documents'])
     matches = []
     if res and len(res['ids']) > 0:
         # res fields: ids, distances, metadatas, documents
@@ -43,4 +54,7 @@ def query_vectors(query_embedding, top_k: int = 4):
 
 
 def persist():
-    chroma_client.persist()
\ No newline at end of file
+    raise RuntimeError(
+        "vectorstore.persist() is no longer needed: the persistent Chroma client "
+        "writes through on every call. Remove the call."
+    )
@@ -0,0 +1,146 @@
+# app/write_behind.py
+import os
+import asyncio
+import logging
+from collections import defaultdict, deque
+from .db_async import save_messages, load_conversation
+
+logger = logging.getLogger(__name__)
+
+# "batched": messages are queued and committed by a background task (write-behind);
+# "sync": each turn is committed before the response is returned
+MESSAGE_DURABILITY = os.getenv("MESSAGE_DURABILITY", "batched")
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", "10000"))
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "256"))
+# How long the writer waits to coalesce more messages into one transaction
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.05"))
+# A failed batch stays pending and is retried with exponential backoff (database
+# locked, failover); only after this many retries are its rows dropped
+MESSAGE_WRITE_RETRIES = int(os.getenv("MESSAGE_WRITE_RETRIES", "5"))
+MESSAGE_RETRY_BACKOFF = float(os.getenv("MESSAGE_RETRY_BACKOFF", "0.5"))
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages. save() enqueues and returns; a
+    background task commits queued rows in batches, one transaction per batch.
+    The queue is bounded, so a stalled database applies backpressure instead
+    of growing memory. Rows not yet committed are visible through
+    load(), so a follow-up request still sees the previous turn. Failed
+    batches are retried in order before anything queued behind them.
+    """
+
+    def __init__(self, write_batch, load_conversation, durability: str = MESSAGE_DURABILITY):
+        self._write_batch = write_batch  # async; rows: list of (conversation_id, role, content)
+        self._load_conversation = load_conversation  # async (user_id, limit) -> (conversation_id, history)
+        self.durability = durability
+        self._queue = None
+        self._task = None
+        self._pending = defaultdict(deque)
+        # commits are exclusive against history reads; reads run concurrently with each other
+        self._commit_lock = asyncio.Lock()
+        self._readers = 0
+        self._no_readers = asyncio.Event()
+        self._no_readers.set()
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self.durability == "sync" or self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=MESSAGE_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def save(self, rows: list[tuple]):
+        if self._task is None:
+            await self._commit(rows)
+            return
+        for conversation_id, role, content in rows:
+            self._pending[conversation_id].append({"role": role, "content": content})
+        for row in rows:
+            await self._queue.put(row)
+
+    async def load(self, user_id, limit: int = 10):
+        """(conversation_id, committed history plus queued messages), oldest first."""
+        async with self._commit_lock:  # wait out an in-flight commit
+            self._readers += 1
+            self._no_readers.clear()
+        try:
+            conversation_id, rows = await self._load_conversation(user_id, limit=limit)
+            rows.extend(self._pending.get(conversation_id, ()))
+        finally:
+            self._readers -= 1
+            if not self._readers:
+                self._no_readers.set()
+        return conversation_id, rows[-limit:]
+
+    async def _commit(self, rows: list[tuple]):
+        async with self._commit_lock:
+            await self._no_readers.wait()
+            await self._write_batch(rows)
+            self._forget(rows)
+        self.written += len(rows)
+        self.batches += 1
+
+    def _forget(self, rows: list[tuple]):
+        """Rows are committed (or given up on): no longer pending."""
+        for conversation_id, _, _ in rows:
+            pending = self._pending.get(conversation_id)
+            if pending:
+                pending.popleft()
+                if not pending:
+                    del self._pending[conversation_id]
+
+    async def _commit_with_retry(self, rows: list[tuple]):
+        for attempt in range(MESSAGE_WRITE_RETRIES + 1):
+            try:
+                await self._commit(rows)
+                return
+            except Exception:
+                if attempt == MESSAGE_WRITE_RETRIES:
+                    logger.exception("Dropping %d chat messages after %d retries", len(rows), attempt)
+                    self._forget(rows)
+                    self.dropped += len(rows)
+                    return
+                self.retries += 1
+                logger.warning("Failed to persist %d chat messages, retrying", len(rows), exc_info=True)
+                await asyncio.sleep(MESSAGE_RETRY_BACKOFF * 2 ** attempt)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+            batch = [row]
+            await asyncio.sleep(MESSAGE_FLUSH_INTERVAL)
+            while len(batch) < MESSAGE_BATCH_SIZE and not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._commit_with_retry(batch)
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
+
+
+message_writer = MessageWriter(save_messages, load_conversation)
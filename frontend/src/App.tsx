@@ -227,26 +227,58 @@ function App() {
     formData.append("user_id", userId);
     formData.append("message", message.trim());
 
+    const assistantId = generateMessageId();
+    let streamed = "";
+
     try {
-      const res = await fetch("http://127.0.0.1:8000/chat", {
+      const res = await fetch("http://127.0.0.1:8000/chat/stream", {
         method: "POST",
         body: formData,
       });
       
-      if (!res.ok) throw new Error(`HTTP error: ${res.status}`);
-      
-      const data = await res.json();
-      const newConversationId = data.conversation_id ? String(data.conversation_id) : "";
-      setConversationId(newConversationId);
+      if (!res.ok || !res.body) throw new Error(`HTTP error: ${res.status}`);
 
-      const assistantMsg: Message = {
-        id: generateMessageId(),
-        role: "assistant", 
-        content: String(data.answer || "No response received"),
+      setMessages((prev) => [...prev, {
+        id: assistantId,
+        role: "assistant",
+        content: "",
         timestamp: new Date()
-      };
-      
-      setMessages((prev) => [...prev, assistantMsg]);
+      }]);
+
+      // Parse Server-Sent Events: "event: <name>" (optional) followed by "data: <json>"
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() ?? "";
+        for (const raw of events) {
+          let event = "message";
+          let payload = "";
+          for (const line of raw.split("\n")) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) payload += line.slice(6);
+          }
+          if (!payload) continue;
+          const data = JSON.parse(payload);
+          if (event === "meta") {
+            setConversationId(data.conversation_id ? String(data.conversation_id) : "");
+          } else if (event === "error") {
+            throw new Error(data.detail || "Stream error");
+          } else if (event === "message" && data.token) {
+            streamed += data.token;
+            const content = streamed;
+            setMessages((prev) => prev.map(msg => msg.id === assistantId ? { ...msg, content } : msg));
+          }
+        }
+      }
+
+      if (!streamed) {
+        setMessages((prev) => prev.map(msg => msg.id === assistantId ? { ...msg, content: "No response received" } : msg));
+      }
       setMessage("");
       
       // Focus back to textarea
@@ -256,6 +288,7 @@ function App() {
       
     } catch (err) {
       console.error(err);
+      setMessages((prev) => prev.filter(msg => msg.id !== assistantId || msg.content));
       const errorMsg: Message = {
         id: generateMessageId(),
         role: "system", 
@@ -372,6 +405,7 @@ function App() {
     const formData = new FormData();
     formData.append("user_id", userId);
     formData.append("message", lastUserMessage.content);
+    formData.append("no_cache", "true"); // a fresh answer, not the cached one
 
     try {
       const res = await fetch("http://127.0.0.1:8000/chat", {
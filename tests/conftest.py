@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Keep app modules that open stores at import time away from the working tree
+_tmp = tempfile.mkdtemp(prefix="rag_bot_tests_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/app.db")
+os.environ.setdefault("CHROMA_DB_DIR", os.path.join(_tmp, "chroma"))
+os.environ.setdefault("EMBED_CACHE_PATH", os.path.join(_tmp, "embedding_cache.db"))
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.semantic_cache import SemanticCache, is_follow_up
+
+HISTORY = [
+    {"role": "user", "content": "What is a graph?"},
+    {"role": "assistant", "content": "A set of vertices joined by edges."},
+]
+LATER_HISTORY = HISTORY + [
+    {"role": "user", "content": "What is a heap?"},
+    {"role": "assistant", "content": "A tree-shaped priority queue."},
+]
+
+
+def vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_follow_up_detection():
+    assert is_follow_up("tell me more")
+    assert is_follow_up("How does it work?")
+    assert not is_follow_up("What is a binary search tree?")
+
+
+def test_paraphrase_hits_with_history_present():
+    cache = SemanticCache(threshold=0.9)
+    cache.put("u1", "What is a heap?", vec(1, 0, 0), "A heap is ...", ["c1", "c2"], HISTORY)
+    answer = cache.lookup("u1", "what is  a HEAP?", vec(0.99, 0.05, 0), ["c1", "c2"], LATER_HISTORY)
+    assert answer == "A heap is ..."
+    assert cache.stats()["hits"] == 1
+
+
+def test_follow_up_needs_the_same_last_exchange():
+    cache = SemanticCache(threshold=0.9)
+    cache.put("u1", "tell me more", vec(0, 1, 0), "More about graphs", ["c1"], HISTORY)
+    assert cache.lookup("u1", "tell me more", vec(0, 1, 0), ["c1"], LATER_HISTORY) is None
+    assert cache.stats()["false_positives"] == 1
+    assert cache.lookup("u1", "tell me more", vec(0, 1, 0), ["c1"], HISTORY) == "More about graphs"
+
+
+def test_other_users_never_match():
+    cache = SemanticCache(threshold=0.9)
+    cache.put("u1", "What is a heap?", vec(1, 0, 0), "A heap is ...", ["c1"], [])
+    assert cache.lookup("u2", "What is a heap?", vec(1, 0, 0), ["c1"], []) is None
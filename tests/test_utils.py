@@ -0,0 +1,35 @@
+import random
+
+from app.utils import chunk_by_tokens
+
+
+def count_words(texts):
+    return [len(t.split()) for t in texts]
+
+
+def words(n, word="w"):
+    return " ".join([word] * n)
+
+
+def test_chunk_after_paragraph_overlap_stays_within_limit():
+    text = words(109) + ". " + words(19) + ".\n\n" + words(239) + ". " + words(10) + "."
+    chunks = chunk_by_tokens(text, count_words, max_tokens=254, overlap_tokens=32)
+    assert max(count_words(chunks)) <= 254
+
+
+def test_chunks_never_exceed_max_tokens():
+    rng = random.Random(0)
+    for _ in range(2000):
+        paragraphs = []
+        for _ in range(rng.randint(1, 6)):
+            sentences = [words(rng.randint(1, 300)) + "." for _ in range(rng.randint(1, 8))]
+            paragraphs.append(" ".join(sentences))
+        max_tokens = rng.choice([16, 64, 254])
+        chunks = chunk_by_tokens("\n\n".join(paragraphs), count_words, max_tokens, max_tokens // 8)
+        assert max(count_words(chunks)) <= max_tokens
+
+
+def test_overlong_word_is_cut_on_characters():
+    count_chars = lambda texts: [len(t) for t in texts]
+    chunks = chunk_by_tokens("x" * 30, count_chars, max_tokens=10, overlap_tokens=0)
+    assert chunks == ["x" * 10] * 3
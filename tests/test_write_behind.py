@@ -0,0 +1,47 @@
+import asyncio
+
+from app import write_behind
+from app.write_behind import MessageWriter
+
+ROWS = [(1, "user", "What is a heap?"), (1, "assistant", "A tree-shaped priority queue.")]
+
+
+def run_writer(monkeypatch, failures: int):
+    monkeypatch.setattr(write_behind, "MESSAGE_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(write_behind, "MESSAGE_FLUSH_INTERVAL", 0)
+    stored = []
+    attempts = {"left": failures}
+
+    async def write_batch(rows):
+        if attempts["left"]:
+            attempts["left"] -= 1
+            raise RuntimeError("database is locked")
+        stored.extend(rows)
+
+    async def load_conversation(user_id, limit=10):
+        return 1, [{"role": r, "content": c} for _, r, c in stored]
+
+    writer = MessageWriter(write_batch, load_conversation, durability="batched")
+
+    async def scenario():
+        await writer.start()
+        await writer.save(ROWS)
+        await writer.stop()
+        return await writer.load("u1")
+
+    return writer, stored, asyncio.run(scenario())
+
+
+def test_failed_batch_is_retried_and_persisted(monkeypatch):
+    writer, stored, (_, history) = run_writer(monkeypatch, failures=1)
+    assert stored == ROWS
+    assert [m["content"] for m in history] == [c for _, _, c in ROWS]  # not duplicated from pending
+    assert writer.stats()["retries"] == 1
+    assert writer.stats()["dropped"] == 0
+
+
+def test_rows_dropped_after_retries_are_counted(monkeypatch):
+    writer, stored, (_, history) = run_writer(monkeypatch, failures=write_behind.MESSAGE_WRITE_RETRIES + 1)
+    assert stored == []
+    assert history == []
+    assert writer.stats()["dropped"] == len(ROWS)